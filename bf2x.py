@@ -10,257 +10,485 @@
 #   7 Rust    (.rs)
 #   0 ALL     (emit all; auto-run py/go if available)
 #
+# Usage: bf2x.py [--execpy] [file.bf]
+# Without a file argument a file dialog asks for one. --execpy skips the
+# target menu and runs the program in-process via a compiled Python function
+# instead of writing any files.
+#
 # Outputs are written to: <folder_of_input_bf>/transpiled/<base>_<suffix>.<ext>
 
-import sys, os, subprocess, tkinter as tk
-from tkinter import filedialog
+import sys, os, io, re, mmap, hashlib, subprocess
+from array import array
 
-BF_OPS = set("><+-.,[]")
+_NOT_BF_RE = re.compile(rb"[^+\-<>.,\[\]]+")
+_TOKEN_RE = re.compile(rb"\++|-+|<+|>+|[.,\[\]]")
 
 # ---------- Front-end ----------
-def sanitize(src: str) -> str:
-    return "".join(c for c in src if c in BF_OPS)
-
-def fold_runs(ops: str):
-    out = []; i = 0; n = len(ops)
-    while i < n:
-        c = ops[i]
-        if c in "+-<>":
-            j = i + 1
-            while j < n and ops[j] == c: j += 1
-            out.append((c, j - i)); i = j
-        else:
-            out.append((c, 1)); i += 1
-    return out
-
-def desugar(tokens):
-    out = []; i = 0
-    while i < len(tokens):
-        if i + 2 < len(tokens) and tokens[i] == ('[',1) and tokens[i+1] == ('-',1) and tokens[i+2] == (']',1):
-            out.append(('CLR',1)); i += 3
-        else:
-            out.append(tokens[i]); i += 1
-    return out
+# A program is kept as two parallel arrays: ops (uint8 op codes) and args
+# (int32, the run length for plain ops). Besides the plain BF ops, tokenize()
+# emits a few higher-level ops:
+#   OP_CLR    [-] / [+]                 tape[dp] = 0
+#   OP_SCANR  [>], [>>], ...            while tape[dp]: dp += n
+#   OP_SCANL  [<], [<<], ...            while tape[dp]: dp -= n
+#   OP_MUL    e.g. [->+>+++<<]          tape[dp+d] += tape[dp]*k, arg = d*256 + k
+#   OP_ZERO   [-]>[-]>[-]               tape[dp:dp+n] = 0 (dp unchanged)
+#   OP_IF     guard for a MUL group     if tape[dp]: ... (closed by OP_CLOSE)
+# A MUL loop becomes OP_IF, one OP_MUL per target cell, an OP_CLR and an
+# OP_CLOSE: the guard keeps a never-entered loop from touching tape[dp+d],
+# which may lie off the tape. n clears on consecutive cells become OP_ZERO n
+# followed by '>' n-1.
+(OP_RIGHT, OP_LEFT, OP_INC, OP_DEC, OP_OUT, OP_IN, OP_OPEN, OP_CLOSE,
+ OP_CLR, OP_SCANR, OP_SCANL, OP_MUL, OP_ZERO, OP_IF) = range(14)
+OP_OUT1, OP_IN1, OP_EMPTY = 14, 15, 16   # only used as emitter template keys
+# Keyed by byte value: the front-end works on the raw file bytes.
+OP_CODE = {ord('>'): OP_RIGHT, ord('<'): OP_LEFT, ord('+'): OP_INC, ord('-'): OP_DEC,
+           ord('.'): OP_OUT, ord(','): OP_IN, ord('['): OP_OPEN, ord(']'): OP_CLOSE}
+
+def tokenize(src):
+    """Tokenize BF source given as bytes (or any buffer, e.g. an mmap) or str."""
+    # Both passes run inside the regex engine; comments are stripped first so
+    # runs split by whitespace or text still fold into one token.
+    # The hot loop appends to plain lists, which is cheaper than growing
+    # arrays item by item; they are packed into arrays once at the end.
+    if isinstance(src, str): src = src.encode()
+    # Only an innermost loop can be rewritten, so outer loop bodies are never
+    # sliced (which would cost time proportional to their size at every ']').
+    ops = []; args = []; opens = []; inner = False
+    for s in _TOKEN_RE.findall(_NOT_BF_RE.sub(b"", src)):
+        op = OP_CODE[s[0]]
+        if op == OP_OPEN:
+            opens.append(len(ops)); inner = True
+        elif op == OP_CLOSE and opens:
+            start = opens.pop()
+            repl = rewrite_loop(ops[start+1:], args[start+1:]) if inner else None
+            inner = False
+            if repl is not None:
+                del ops[start:]; del args[start:]
+                for op, n in repl: ops.append(op); args.append(n)
+                merge_zero_run(ops, args)
+                continue
+        elif op == OP_RIGHT and ops and ops[-1] == OP_RIGHT:
+            args[-1] += len(s)   # a '>' left behind by merge_zero_run()
+            continue
+        elif op == OP_INC or op == OP_DEC:
+            # Cells are bytes, so reduce mod 256: the count then fits a u8
+            # literal and backends can rely on native byte wrap-around.
+            ops.append(op); args.append(len(s) % 256)
+            continue
+        ops.append(op); args.append(len(s))
+    return array('B', ops), array('i', args)
+
+def merge_zero_run(ops, args):
+    # [CLR, '>' 1, CLR] -> [ZERO 2, '>' 1]; [ZERO k, '>' k, CLR] -> [ZERO k+1, '>' k]
+    if len(ops) < 3 or ops[-1] != OP_CLR or ops[-2] != OP_RIGHT: return
+    if   ops[-3] == OP_CLR:  k = 1
+    elif ops[-3] == OP_ZERO: k = args[-3]
+    else: return
+    if args[-2] != k: return
+    del ops[-3:]; del args[-3:]
+    ops.extend((OP_ZERO, OP_RIGHT)); args.extend((k + 1, k))
+
+def tokenize_file(path: str):
+    # BF is ASCII, so map the file and tokenize its bytes directly instead of
+    # reading and decoding it into a str first.
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: return tokenize(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return tokenize(mm)
+
+def rewrite_loop(ops, args):
+    """Return replacement (op, arg) pairs for a loop body with no nested loops, or None."""
+    if len(ops) == 1 and ops[0] in (OP_RIGHT, OP_LEFT):
+        return [(OP_SCANR if ops[0] == OP_RIGHT else OP_SCANL, args[0])]
+    dp = 0; delta = {}
+    for op, n in zip(ops, args):
+        if   op == OP_RIGHT: dp += n
+        elif op == OP_LEFT:  dp -= n
+        elif op == OP_INC:   delta[dp] = delta.get(dp, 0) + n
+        elif op == OP_DEC:   delta[dp] = delta.get(dp, 0) - n
+        else: return None
+    step = delta.pop(0, 0) % 256
+    if dp != 0 or step not in (1, 255): return None
+    # [-...] runs tape[dp] times, [+...] runs 256 - tape[dp] (i.e. -tape[dp]) times.
+    if step == 1: delta = {d: -k for d, k in delta.items()}
+    muls = [(OP_MUL, d * 256 + k % 256) for d, k in sorted(delta.items()) if k % 256]
+    if not muls: return [(OP_CLR, 1)]
+    return [(OP_IF, 1)] + muls + [(OP_CLR, 1), (OP_CLOSE, 1)]
 
 # ---------- Emitters ----------
-def emit_python(tokens) -> str:
-    L = []; w = L.append
-    w("import sys")
-    w("tape = bytearray(300000)"); w("dp = 0"); w("out = []")
-    w("")
-    w("def getchar():")
-    w("    b = sys.stdin.buffer.read(1)")
-    w("    return b[0] if b else 0")
-    w("")
-    ind = 0
-    def e(s): L.append(('    '*ind)+s)
-    for op, n in tokens:
-        if   op == '>': e(f"dp += {n}")
-        elif op == '<': e(f"dp -= {n}")
-        elif op == '+': e(f"tape[dp] = (tape[dp] + {n}) & 255")
-        elif op == '-': e(f"tape[dp] = (tape[dp] - {n}) & 255")
-        elif op == '.':
-            e("out.append(tape[dp])") if n == 1 else e(f"for _ in range({n}): out.append(tape[dp])")
-        elif op == ',':
-            if n == 1: e("tape[dp] = getchar()")
-            else: e(f"for _ in range({n}): tape[dp] = getchar()")
-        elif op == 'CLR': e("tape[dp] = 0")
-        elif op == '[': e("while tape[dp] != 0:"); ind += 1
-        elif op == ']': ind = max(0, ind - 1)
-    w("sys.stdout.buffer.write(bytes(out))")
-    w("")
-    return "\n".join(L)
-
-def emit_go(tokens) -> str:
-    has_in = any(op == ',' for op, _ in tokens)
-    L = []; w = L.append
-    w("package main"); w("")
-    w("import (")
-    w('    "bufio"')
-    if has_in: w('    "io"')
-    w('    "os"')
-    w(")"); w("")
-    w("func main(){")
-    w("    tape := make([]byte, 300000)")
-    w("    dp := 0")
-    w("    out := bufio.NewWriter(os.Stdout)")
-    w("    defer out.Flush()")
+INDENTS = ['']
+def indent(level: int) -> str:
+    # Shared cache of indent prefixes, grown on demand; emitters only look one
+    # up when the nesting depth changes.
+    while len(INDENTS) <= level: INDENTS.append('    ' * len(INDENTS))
+    return INDENTS[level]
+
+# Per-target line templates keyed by op code, %-formatted with the op's arg:
+# the count for run-length ops, (d, d, k) for OP_MUL, {'n': count} for OP_ZERO
+# and () for fixed lines.
+# OP_OUT1/OP_IN1 are the n == 1 forms of OP_OUT/OP_IN; OP_EMPTY is the line
+# for a block with nothing in it (only Python needs one). None or a missing
+# key emits no line.
+# Where the target has a cheap block write, OP_OUT fills a 64-byte buffer with
+# the cell once and writes it in slices rather than one byte per call.
+PY_TPL = {
+    OP_RIGHT: 'dp += %d',
+    OP_LEFT: 'dp -= %d',
+    OP_INC: 'tape[dp] = (tape[dp] + %d) & 255',
+    OP_DEC: 'tape[dp] = (tape[dp] - %d) & 255',
+    OP_OUT: 'for _ in range(%d): put(tape[dp])',
+    OP_OUT1: 'put(tape[dp])',
+    OP_IN: 'for _ in range(%d): tape[dp] = getchar()',
+    OP_IN1: 'tape[dp] = getchar()',
+    OP_OPEN: 'while tape[dp] != 0:',
+    OP_IF: 'if tape[dp] != 0:',
+    OP_CLOSE: None,
+    OP_EMPTY: 'pass',
+    OP_CLR: 'tape[dp] = 0',
+    OP_SCANR: 'while tape[dp] != 0: dp += %d',
+    OP_SCANL: 'while tape[dp] != 0: dp -= %d',
+    OP_MUL: 'tape[dp%+d] = (tape[dp%+d] + tape[dp]*%d) & 255',
+    OP_ZERO: 'tape[dp:dp+%(n)d] = bytes(%(n)d)',
+}
+GO_TPL = {
+    OP_RIGHT: 'dp += %d',
+    OP_LEFT: 'dp -= %d',
+    OP_INC: 'tape[dp] += %d',
+    OP_DEC: 'tape[dp] -= %d',
+    OP_OUT: '{ var b [64]byte; for i := range b { b[i] = tape[dp] }; for r := %d; r > 0; r -= 64 { k := r; if k > 64 { k = 64 }; out.Write(b[:k]) } }',
+    OP_OUT1: 'out.WriteByte(tape[dp])',
+    OP_IN: 'for i:=0; i<%d; i++ { tape[dp] = getchar() }',
+    OP_IN1: 'tape[dp] = getchar()',
+    OP_OPEN: 'for tape[dp] != 0 {',
+    OP_IF: 'if tape[dp] != 0 {',
+    OP_CLOSE: '}',
+    OP_CLR: 'tape[dp] = 0',
+    OP_SCANR: 'for tape[dp] != 0 { dp += %d }',
+    OP_SCANL: 'for tape[dp] != 0 { dp -= %d }',
+    OP_MUL: 'tape[dp%+d] = tape[dp%+d] + tape[dp]*%d',
+    OP_ZERO: '{ z := tape[dp:dp+%(n)d]; for i := range z { z[i] = 0 } }',
+}
+# dp is a restrict-qualified pointer kept in a register, which lets the C++
+# compiler vectorise scans and clears.
+CPP_TPL = {
+    OP_RIGHT: 'p += %d;',
+    OP_LEFT: 'p -= %d;',
+    OP_INC: '*p += %d;',
+    OP_DEC: '*p -= %d;',
+    OP_OUT: '{ char b[64]; std::memset(b, *p, sizeof b); for(int r=%d; r>0; r-=64) std::cout.write(b, r<64?r:64); }',
+    OP_OUT1: 'std::cout.put((char)*p);',
+    OP_IN: 'for(int i=0;i<%d;++i){ int c=std::cin.get(); *p=(c==EOF?0:(unsigned char)c); }',
+    OP_IN1: '{ int c = std::cin.get(); *p = (c==EOF?0:(unsigned char)c); }',
+    OP_OPEN: 'while(*p != 0){',
+    OP_IF: 'if(*p != 0){',
+    OP_CLOSE: '}',
+    OP_CLR: '*p = 0;',
+    OP_SCANR: 'while(*p != 0) p += %d;',
+    OP_SCANL: 'while(*p != 0) p -= %d;',
+    OP_MUL: 'p[%d] = (unsigned char)(p[%d] + *p * %d);',
+    OP_ZERO: 'std::memset(p, 0, %(n)d);',
+}
+CS_TPL = {
+    OP_RIGHT: 'dp += %d;',
+    OP_LEFT: 'dp -= %d;',
+    OP_INC: 'tape[dp] = (byte)((tape[dp] + %d) & 255);',
+    OP_DEC: 'tape[dp] = (byte)((tape[dp] - %d) & 255);',
+    OP_OUT: 'for (int i=0;i<%d;i++) stdout.WriteByte(tape[dp]);',
+    OP_OUT1: 'stdout.WriteByte(tape[dp]);',
+    OP_IN: 'for (int i=0;i<%d;i++) { int c = input.ReadByte(); tape[dp] = (byte)(c==-1?0:c); }',
+    OP_IN1: '{ int c = input.ReadByte(); tape[dp] = (byte)(c==-1?0:c); }',
+    OP_OPEN: 'while (tape[dp] != 0) {',
+    OP_IF: 'if (tape[dp] != 0) {',
+    OP_CLOSE: '}',
+    OP_CLR: 'tape[dp] = 0;',
+    OP_SCANR: 'while (tape[dp] != 0) dp += %d;',
+    OP_SCANL: 'while (tape[dp] != 0) dp -= %d;',
+    OP_MUL: 'tape[dp%+d] = (byte)((tape[dp%+d] + tape[dp]*%d) & 255);',
+    OP_ZERO: 'Array.Clear(tape, dp, %(n)d);',
+}
+LUA_TPL = {
+    OP_RIGHT: 'dp = dp + %d',
+    OP_LEFT: 'dp = dp - %d',
+    OP_INC: 'tape[dp] = (tape[dp] + %d) %% 256',
+    OP_DEC: 'tape[dp] = (tape[dp] - %d) %% 256',
+    OP_OUT: 'for i=1,%d do io.write(string.char(tape[dp])) end',
+    OP_OUT1: 'io.write(string.char(tape[dp]))',
+    OP_IN: 'for i=1,%d do tape[dp] = getchar() end',
+    OP_IN1: 'tape[dp] = getchar()',
+    OP_OPEN: 'while tape[dp] ~= 0 do',
+    OP_IF: 'if tape[dp] ~= 0 then',
+    OP_CLOSE: 'end',
+    OP_CLR: 'tape[dp] = 0',
+    OP_SCANR: 'while tape[dp] ~= 0 do dp = dp + %d end',
+    OP_SCANL: 'while tape[dp] ~= 0 do dp = dp - %d end',
+    OP_MUL: 'tape[dp%+d] = (tape[dp%+d] + tape[dp]*%d) %% 256',
+    OP_ZERO: 'for i=dp,dp+%(n)d-1 do tape[i]=0 end',
+}
+RB_TPL = {
+    OP_RIGHT: 'dp += %d',
+    OP_LEFT: 'dp -= %d',
+    OP_INC: 'tape[dp] = (tape[dp] + %d) & 0xFF',
+    OP_DEC: 'tape[dp] = (tape[dp] - %d) & 0xFF',
+    OP_OUT: '%d.times { STDOUT.write(tape[dp].chr) }',
+    OP_OUT1: 'STDOUT.write(tape[dp].chr)',
+    OP_IN: '%d.times { tape[dp] = getchar }',
+    OP_IN1: 'tape[dp] = getchar',
+    OP_OPEN: 'while tape[dp] != 0',
+    OP_IF: 'if tape[dp] != 0',
+    OP_CLOSE: 'end',
+    OP_CLR: 'tape[dp] = 0',
+    OP_SCANR: 'dp += %d while tape[dp] != 0',
+    OP_SCANL: 'dp -= %d while tape[dp] != 0',
+    OP_MUL: 'tape[dp%+d] = (tape[dp%+d] + tape[dp]*%d) & 0xFF',
+    OP_ZERO: 'tape.fill(0, dp, %(n)d)',
+}
+RS_TPL = {
+    OP_RIGHT: 'dp += %d;',
+    OP_LEFT: 'dp -= %d;',
+    OP_INC: 'tape[dp] = tape[dp].wrapping_add(%d);',
+    OP_DEC: 'tape[dp] = tape[dp].wrapping_sub(%d);',
+    OP_OUT: '{ let b = [tape[dp]; 64]; let mut r: usize = %d; while r > 0 { let k = r.min(64); out.write_all(&b[..k]).unwrap(); r -= k; } }',
+    OP_OUT1: 'out.write_all(&[tape[dp]]).unwrap();',
+    OP_IN: 'for _ in 0..%d { tape[dp] = getchar(); }',
+    OP_IN1: 'tape[dp] = getchar();',
+    OP_OPEN: 'while tape[dp] != 0 {',
+    OP_IF: 'if tape[dp] != 0 {',
+    OP_CLOSE: '}',
+    OP_CLR: 'tape[dp] = 0;',
+    OP_SCANR: 'while tape[dp] != 0 { dp += %d; }',
+    OP_SCANL: 'while tape[dp] != 0 { dp -= %d; }',
+    OP_MUL: 'tape[dp%+d] = tape[dp%+d].wrapping_add(tape[dp].wrapping_mul(%d));',
+    OP_ZERO: 'tape[dp..dp+%(n)d].fill(0);',
+}
+
+def _body_lines(tokens):
+    """Number the distinct (depth, op, arg) lines of the program body.
+    Returns the lines in first-seen order and the line number of every token.
+    An empty block (a bare [] or a program with no ops) gets an OP_EMPTY line."""
+    ops, args = tokens
+    depth = 0; ids = {}; index = []; prev = None
+    for op, n in zip(ops, args):
+        if op == OP_CLOSE:
+            if prev == OP_OPEN: index.append(ids.setdefault((depth, OP_EMPTY, 0), len(ids)))
+            if depth: depth -= 1
+        index.append(ids.setdefault((depth, op, n), len(ids)))
+        if op == OP_OPEN or op == OP_IF: depth += 1
+        prev = op
+    if not index: index.append(ids.setdefault((0, OP_EMPTY, 0), 0))
+    return list(ids), index
+
+def _format_line(line, tpl, ind: int) -> str:
+    depth, op, n = line
+    key = op; a = n
+    if op == OP_MUL: d, k = divmod(n, 256); a = (d, d, k)
+    elif op == OP_ZERO: a = {'n': n}
+    elif op in (OP_OPEN, OP_IF, OP_CLOSE, OP_CLR, OP_EMPTY): a = ()
+    elif n == 1 and op in (OP_OUT, OP_IN): key = OP_OUT1 if op == OP_OUT else OP_IN1; a = ()
+    t = tpl.get(key)
+    return "" if t is None else indent(ind + depth) + t % a + "\n"
+
+def _emit_body(w, body, tpl, ind: int):
+    # Programs repeat the same few lines over and over, so each distinct line
+    # is formatted once and the body is joined from those strings.
+    lines, index = body
+    text = [_format_line(line, tpl, ind) for line in lines]
+    w("".join(map(text.__getitem__, index)))
+
+# ---- Per-target prologue / epilogue ----
+# The Python program body lives in a function so tape, dp, put (out.append)
+# and getchar are fast locals rather than module globals.
+def _py_run_def(w):
+    w("def _run(tape, dp, put, getchar):\n")
+
+def _py_head(w, has_in):
+    w("import sys\n")
+    w("\n")
+    w("def getchar(read=sys.stdin.buffer.read):\n")
+    w("    b = read(1)\n")
+    w("    return b[0] if b else 0\n")
+    w("\n")
+    _py_run_def(w)
+
+def _py_tail(w):
+    w("\n")
+    w("out = bytearray()\n")
+    w("_run(bytearray(300000), 0, out.append, getchar)\n")
+    w("sys.stdout.buffer.write(out)\n")
+
+def _go_head(w, has_in):
+    w("package main\n"); w("\n")
+    w("import (\n")
+    w('    "bufio"\n')
+    if has_in: w('    "io"\n')
+    w('    "os"\n')
+    w(")\n"); w("\n")
+    w("func main(){\n")
+    w("    tape := make([]byte, 300000)\n")
+    w("    dp := 0\n")
+    w("    out := bufio.NewWriter(os.Stdout)\n")
+    w("    defer out.Flush()\n")
     if has_in:
-        w("    in := bufio.NewReader(os.Stdin)")
-        w("    getchar := func() byte {")
-        w("        b, err := in.ReadByte()")
-        w("        if err != nil { if err == io.EOF { return 0 }; return 0 }")
-        w("        return b")
-        w("    }")
-    ind = 1
-    def e(s): L.append(('    '*ind)+s)
-    for op, n in tokens:
-        if   op == '>': e(f"dp += {n}")
-        elif op == '<': e(f"dp -= {n}")
-        elif op == '+': e(f"tape[dp] = byte(int(tape[dp]+byte({n})) & 255)")
-        elif op == '-': e(f"tape[dp] = byte(int(tape[dp]-byte({n})) & 255)")
-        elif op == '.':
-            e("out.WriteByte(tape[dp])") if n == 1 else e(f"for i:=0; i<{n}; i++ {{ out.WriteByte(tape[dp]) }}")
-        elif op == ',' and has_in:
-            e("tape[dp] = getchar()") if n == 1 else e(f"for i:=0; i<{n}; i++ {{ tape[dp] = getchar() }}")
-        elif op == 'CLR': e("tape[dp] = 0")
-        elif op == '[': e("for tape[dp] != 0 {"); ind += 1
-        elif op == ']': ind = max(1, ind - 1); e("}")
-    w("}")
-    w("")
-    return "\n".join(L)
-
-def emit_cpp(tokens) -> str:
-    has_in = any(op == ',' for op, _ in tokens)
-    L = []; w = L.append
-    w("#include <iostream>")
-    w("int main(){")
-    w("    static unsigned char tape[300000] = {0};")
-    w("    size_t dp = 0;")
-    w("    std::ios::sync_with_stdio(false); std::cin.tie(nullptr);")
-    ind = 1
-    def e(s): L.append(('    '*ind)+s)
-    for op, n in tokens:
-        if   op == '>': e(f"dp += {n};")
-        elif op == '<': e(f"dp -= {n};")
-        elif op == '+': e(f"tape[dp] = (tape[dp] + {n}) & 255;")
-        elif op == '-': e(f"tape[dp] = (tape[dp] - {n}) & 255;")
-        elif op == '.':
-            e("std::cout.put((char)tape[dp]);") if n == 1 else e(f"for(int i=0;i<{n};++i) std::cout.put((char)tape[dp]);")
-        elif op == ',' and has_in:
-            if n == 1:
-                e("int c = std::cin.get(); tape[dp] = (c==EOF?0:(unsigned char)c);")
-            else:
-                e(f"for(int i=0;i<{n};++i){{ int c=std::cin.get(); tape[dp]=(c==EOF?0:(unsigned char)c); }}")
-        elif op == 'CLR': e("tape[dp] = 0;")
-        elif op == '[': e("while(tape[dp] != 0){"); ind += 1
-        elif op == ']': ind = max(1, ind - 1); e("}")
-    e("return 0;")
-    w("}")
-    w("")
-    return "\n".join(L)
-
-def emit_csharp(tokens) -> str:
-    has_in = any(op == ',' for op, _ in tokens)
-    L = []; w = L.append
-    w("using System;")
-    w("using System.IO;")
-    w("class Program { static void Main(){")
-    w("    byte[] tape = new byte[300000]; int dp = 0;")
-    if has_in: w("    Stream input = Console.OpenStandardInput();")
-    w("    var stdout = Console.OpenStandardOutput();")
-    ind = 1
-    def e(s): L.append(('    '*ind)+s)
-    for op, n in tokens:
-        if   op == '>': e(f"dp += {n};")
-        elif op == '<': e(f"dp -= {n};")
-        elif op == '+': e(f"tape[dp] = (byte)((tape[dp] + {n}) & 255);")
-        elif op == '-': e(f"tape[dp] = (byte)((tape[dp] - {n}) & 255);")
-        elif op == '.':
-            if n == 1: e("stdout.WriteByte(tape[dp]);")
-            else: e(f"for (int i=0;i<{n};i++) stdout.WriteByte(tape[dp]);")
-        elif op == ',' and has_in:
-            if n == 1:
-                e("int c = input.ReadByte(); tape[dp] = (byte)(c==-1?0:c);")
-            else:
-                e(f"for (int i=0;i<{n};i++) {{ int c = input.ReadByte(); tape[dp] = (byte)(c==-1?0:c); }}")
-        elif op == 'CLR': e("tape[dp] = 0;")
-        elif op == '[': e("while (tape[dp] != 0) {"); ind += 1
-        elif op == ']': ind = max(1, ind - 1); e("}")
-    w("}}")
-    w("")
-    return "\n".join(L)
-
-def emit_lua(tokens) -> str:
-    has_in = any(op == ',' for op, _ in tokens)
-    L = []; w = L.append
-    w("local tape = {} for i=1,300000 do tape[i]=0 end")
-    w("local dp = 1")
+        w("    in := bufio.NewReader(os.Stdin)\n")
+        w("    getchar := func() byte {\n")
+        w("        b, err := in.ReadByte()\n")
+        w("        if err != nil { if err == io.EOF { return 0 }; return 0 }\n")
+        w("        return b\n")
+        w("    }\n")
+
+def _go_tail(w):
+    w("}\n")
+
+def _cpp_head(w, has_in):
+    w("#include <cstring>\n")
+    w("#include <iostream>\n")
+    w("int main(){\n")
+    w("    alignas(64) static unsigned char tape[300000] = {0};\n")
+    w("    unsigned char * __restrict__ p = tape;\n")
+    w("    std::ios::sync_with_stdio(false); std::cin.tie(nullptr);\n")
+
+def _cpp_tail(w):
+    w("    return 0;\n")
+    w("}\n")
+
+def _cs_head(w, has_in):
+    w("using System;\n")
+    w("using System.IO;\n")
+    w("class Program { static void Main(){\n")
+    w("    byte[] tape = new byte[300000]; int dp = 0;\n")
+    if has_in: w("    Stream input = Console.OpenStandardInput();\n")
+    w("    var stdout = Console.OpenStandardOutput();\n")
+
+def _cs_tail(w):
+    w("}}\n")
+
+def _lua_head(w, has_in):
+    # Under LuaJIT the tape is a flat uint8_t array; stock Lua falls back to a
+    # table. Both are indexed from 0, and the % 256 in the templates keeps the
+    # table fallback wrapping correctly.
+    w("local has_ffi, ffi = pcall(require, \"ffi\")\n")
+    w("local tape\n")
+    w("if has_ffi then tape = ffi.new(\"uint8_t[?]\", 300000) else tape = {} for i=0,299999 do tape[i]=0 end end\n")
+    w("local dp = 0\n")
     if has_in:
-        w("local function getchar() local c=io.read(1); if c==nil then return 0 else return string.byte(c) end end")
+        w("local function getchar() local c=io.read(1); if c==nil then return 0 else return string.byte(c) end end\n")
     else:
-        w("local function getchar() return 0 end")
-    ind = 0
-    def e(s): L.append(('    '*ind)+s)
-    for op, n in tokens:
-        if   op == '>': e(f"dp = dp + {n}")
-        elif op == '<': e(f"dp = dp - {n}")
-        elif op == '+': e(f"tape[dp] = (tape[dp] + {n}) % 256")
-        elif op == '-': e(f"tape[dp] = (tape[dp] - {n}) % 256")
-        elif op == '.':
-            if n == 1: e("io.write(string.char(tape[dp]))")
-            else: e(f"for i=1,{n} do io.write(string.char(tape[dp])) end")
-        elif op == ',':
-            if n == 1: e("tape[dp] = getchar()")
-            else: e(f"for i=1,{n} do tape[dp] = getchar() end")
-        elif op == 'CLR': e("tape[dp] = 0")
-        elif op == '[': e("while tape[dp] ~= 0 do"); ind += 1
-        elif op == ']': ind = max(0, ind - 1); e("end")
-    w("")
-    return "\n".join(L)
-
-def emit_ruby(tokens) -> str:
-    has_in = any(op == ',' for op, _ in tokens)
-    L = []; w = L.append
-    w("tape = Array.new(300000, 0)"); w("dp = 0")
-    if has_in: w("def getchar; c=$stdin.read(1); c ? c.ord : 0; end")
-    else: w("def getchar; 0; end")
-    ind = 0
-    def e(s): L.append(('    '*ind)+s)
-    for op, n in tokens:
-        if   op == '>': e(f"dp += {n}")
-        elif op == '<': e(f"dp -= {n}")
-        elif op == '+': e(f"tape[dp] = (tape[dp] + {n}) & 0xFF")
-        elif op == '-': e(f"tape[dp] = (tape[dp] - {n}) & 0xFF")
-        elif op == '.':
-            if n == 1: e("STDOUT.write(tape[dp].chr)")
-            else: e(f"{n}.times {{ STDOUT.write(tape[dp].chr) }}")
-        elif op == ',':
-            if n == 1: e("tape[dp] = getchar")
-            else: e(f"{n}.times {{ tape[dp] = getchar }}")
-        elif op == 'CLR': e("tape[dp] = 0")
-        elif op == '[': e("while tape[dp] != 0"); ind += 1
-        elif op == ']': ind = max(0, ind - 1); e("end")
-    w("")
-    return "\n".join(L)
-
-def emit_rust(tokens) -> str:
-    has_in = any(op == ',' for op, _ in tokens)
-    L = []; w = L.append
-    w("use std::io::{self, Read, Write};")
-    w("fn main(){")
-    w("    let mut tape = [0u8; 300000];")
-    w("    let mut dp: usize = 0;")
-    w("    let mut out = io::BufWriter::new(io::stdout());")
+        w("local function getchar() return 0 end\n")
+
+def _rb_head(w, has_in):
+    w("tape = Array.new(300000, 0)\n"); w("dp = 0\n")
+    if has_in: w("def getchar; c=$stdin.read(1); c ? c.ord : 0; end\n")
+    else: w("def getchar; 0; end\n")
+
+def _rs_head(w, has_in):
+    # A guarded MUL such as tape[dp-1] at dp == 0 is unreachable at run time,
+    # but rustc's const-propagation lint still rejects it at compile time.
+    w("#![allow(arithmetic_overflow)]\n")
+    w("use std::io::{self, Read, Write};\n")
+    w("fn main(){\n")
+    w("    let mut tape = [0u8; 300000];\n")
+    w("    let mut dp: usize = 0;\n")
+    w("    let mut out = io::BufWriter::new(io::stdout());\n")
     if has_in:
-        w("    let mut stdin = io::stdin();")
-        w("    let mut buf = [0u8; 1];")
-        w("    let mut getchar = || -> u8 { match stdin.read(&mut buf) { Ok(1) => buf[0], _ => 0 } };")
-    ind = 1
-    def e(s): L.append(('    '*ind)+s)
-    for op, n in tokens:
-        if   op == '>': e(f"dp += {n};")
-        elif op == '<': e(f"dp -= {n};")
-        elif op == '+': e(f"tape[dp] = tape[dp].wrapping_add({n});")
-        elif op == '-': e(f"tape[dp] = tape[dp].wrapping_sub({n});")
-        elif op == '.':
-            if n == 1: e("out.write_all(&[tape[dp]]).unwrap();")
-            else: e(f"for _ in 0..{n} {{ out.write_all(&[tape[dp]]).unwrap(); }}")
-        elif op == ',' and has_in:
-            if n == 1: e("tape[dp] = getchar();")
-            else: e(f"for _ in 0..{n} {{ tape[dp] = getchar(); }}")
-        elif op == 'CLR': e("tape[dp] = 0;")
-        elif op == '[': e("while tape[dp] != 0 {"); ind += 1
-        elif op == ']': ind = max(1, ind - 1); e("}")
-    e("out.flush().unwrap();")
-    w("}")
-    w("")
-    return "\n".join(L)
+        w("    let mut stdin = io::stdin();\n")
+        w("    let mut buf = [0u8; 1];\n")
+        w("    let mut getchar = || -> u8 { match stdin.read(&mut buf) { Ok(1) => buf[0], _ => 0 } };\n")
+
+def _rs_tail(w):
+    w("    out.flush().unwrap();\n")
+    w("}\n")
+
+# name -> (prologue, templates, body indent, epilogue)
+BACKENDS = {
+    "python": (_py_head,   PY_TPL,  1, _py_tail),
+    "go":     (_go_head,   GO_TPL,  1, _go_tail),
+    "cpp":    (_cpp_head,  CPP_TPL, 1, _cpp_tail),
+    "csharp": (_cs_head,   CS_TPL,  1, _cs_tail),
+    "lua":    (_lua_head,  LUA_TPL, 0, None),
+    "ruby":   (_rb_head,   RB_TPL,  0, None),
+    "rust":   (_rs_head,   RS_TPL,  1, _rs_tail),
+}
+
+def emit_targets(tokens, names) -> dict:
+    """Emit several targets from one shared line index of the tokens; returns {name: code}."""
+    has_in = OP_IN in tokens[0]
+    body = _body_lines(tokens); codes = {}
+    for name in names:
+        head, tpl, ind, tail = BACKENDS[name]
+        buf = io.StringIO(); w = buf.write
+        head(w, has_in)
+        _emit_body(w, body, tpl, ind)
+        if tail: tail(w)
+        codes[name] = buf.getvalue()
+    return codes
+
+def emit_python(tokens) -> str: return emit_targets(tokens, ["python"])["python"]
+def emit_go(tokens) -> str:     return emit_targets(tokens, ["go"])["go"]
+def emit_cpp(tokens) -> str:    return emit_targets(tokens, ["cpp"])["cpp"]
+def emit_csharp(tokens) -> str: return emit_targets(tokens, ["csharp"])["csharp"]
+def emit_lua(tokens) -> str:    return emit_targets(tokens, ["lua"])["lua"]
+def emit_ruby(tokens) -> str:   return emit_targets(tokens, ["ruby"])["ruby"]
+def emit_rust(tokens) -> str:   return emit_targets(tokens, ["rust"])["rust"]
+
+def build_py_code(tokens):
+    """Compile the program into a code object defining _run(tape, dp, put, getchar)."""
+    buf = io.StringIO(); w = buf.write
+    _py_run_def(w)
+    _emit_body(w, _body_lines(tokens), PY_TPL, 1)
+    return compile(buf.getvalue(), "<bf>", "exec")
+
+def exec_py(tokens):
+    # In-process alternative to emitting a .py and spawning an interpreter.
+    # Python caps static nesting at 20 blocks, so deeply nested programs can
+    # still fail to compile.
+    try:
+        code = build_py_code(tokens)
+    except SyntaxError as e:
+        print(f"[err] can't compile program: {e.msg}"); return
+    ns = {}
+    exec(code, ns)
+    def getchar():
+        b = sys.stdin.buffer.read(1)
+        return b[0] if b else 0
+    out = bytearray()
+    ns["_run"](bytearray(300000), 0, out.append, getchar)
+    sys.stdout.flush(); sys.stdout.buffer.write(out); sys.stdout.buffer.flush()
+
+# ---- Runners (out_path -> command line) ----
+def python_cmd(out_path: str) -> list[str]:
+    return ["python", out_path]
+
+class BuildError(Exception):
+    """A target's compiler rejected the emitted source."""
+
+def go_cmd(out_path: str) -> list[str]:
+    # `go run` rebuilds every time; build once per distinct source (keyed by a
+    # hash of the .go file) and exec the cached binary afterwards.
+    with open(out_path, "rb") as f:
+        digest = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+    cache_dir = os.path.join(os.path.dirname(out_path), ".gocache")
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(out_path))[0]
+    ext = ".exe" if os.name == "nt" else ""
+    exe = os.path.join(cache_dir, f"{stem}-{digest}{ext}")
+    if not os.path.exists(exe):
+        # Compiler messages travel with the BuildError so callers can print
+        # them under the right target's header.
+        r = subprocess.run(["go", "build", "-o", exe, out_path],
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if r.returncode:
+            log = r.stdout.decode(errors="replace").rstrip()
+            raise BuildError(f"go build exited with {r.returncode}" + (f"\n{log}" if log else ""))
+        # Only the binary for the current source is worth keeping.
+        stale = re.compile(re.escape(stem) + r"-[0-9a-f]{16}" + re.escape(ext))
+        for name in os.listdir(cache_dir):
+            if stale.fullmatch(name) and name != os.path.basename(exe):
+                os.remove(os.path.join(cache_dir, name))
+    return [exe]
 
 # ---- Target registry ----
 TARGETS = {
-    "1": ("python", ".py",  emit_python, ["python", "{out}"]),
-    "2": ("go",     ".go",  emit_go,     ["go", "run", "{out}"]),
+    "1": ("python", ".py",  emit_python, python_cmd),
+    "2": ("go",     ".go",  emit_go,     go_cmd),
     "3": ("cpp",   ".cpp",  emit_cpp,    None),
     "4": ("csharp",".cs",   emit_csharp, None),
     "5": ("lua",   ".lua",  emit_lua,    None),
@@ -280,6 +508,10 @@ def pick_target() -> str:
         print("Enter 0-7")
 
 def pick_bf_path() -> str:
+    # Tk is only needed for the file dialog; importing it lazily keeps startup
+    # fast and lets bf2x run headless when the path is given on the command line.
+    import tkinter as tk
+    from tkinter import filedialog
     tk.Tk().withdraw()
     p = filedialog.askopenfilename(title="Select a Brainfuck (.bf) file",
                                    filetypes=[("Brainfuck","*.bf"), ("All files","*.*")])
@@ -297,42 +529,92 @@ def write_out_next_to_input(bf_path: str, base: str, suffix: str, ext: str, code
         f.write(code)
     return out_path
 
-def try_run(cmd_tpl: list[str], out_path: str):
-    if not cmd_tpl: return
-    cmd = [(out_path if x == "{out}" else x) for x in cmd_tpl]
+def try_run(runner, out_path: str):
+    if not runner: return
     try:
         print("[run] -------- output --------")
-        subprocess.check_call(cmd)
+        subprocess.check_call(runner(out_path))
     except FileNotFoundError as e:
         print(f"[warn] can't auto-run: {e}")
+    except BuildError as e:
+        print(f"[err] build failed: {e}")
     except subprocess.CalledProcessError as e:
         print(f"[err] program exited with {e.returncode}")
 
+def run_concurrently(jobs):
+    """Start every (runner, out_path) job at once, then print their outputs in order.
+    Only for programs that read no input, since the jobs can't share stdin."""
+    # Resolve every command first: a runner may build (go), and that must not
+    # hold up the jobs started after it.
+    cmds = []
+    for runner, out_path in jobs:
+        try: cmds.append(runner(out_path))
+        except (FileNotFoundError, BuildError) as e: cmds.append(e)
+    # stderr shares the stdout pipe so each job's output stays under its header.
+    procs = []
+    for cmd in cmds:
+        try:
+            procs.append(cmd if isinstance(cmd, Exception) else
+                         subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+        except FileNotFoundError as e:
+            procs.append(e)
+    for p in procs:
+        print("[run] -------- output --------")
+        if isinstance(p, FileNotFoundError):
+            print(f"[warn] can't auto-run: {p}"); continue
+        if isinstance(p, BuildError):
+            print(f"[err] build failed: {p}"); continue
+        out, _ = p.communicate()
+        sys.stdout.flush(); sys.stdout.buffer.write(out); sys.stdout.buffer.flush()
+        if p.returncode: print(f"[err] program exited with {p.returncode}")
+
+def write_target(key: str, code: str, bf_path: str, base: str) -> str:
+    name, ext, _, _ = TARGETS[key]
+    suffix = {
+        "python":"_py","go":"_go","cpp":"_cpp","csharp":"_cs",
+        "lua":"_lua","ruby":"_rb","rust":"_rs"
+    }[name]
+    out_path = write_out_next_to_input(bf_path, base, suffix, ext, code)
+    print(f"[ok] wrote {out_path}")
+    return out_path
+
 # ---------- main ----------
 def main():
-    choice = pick_target()
-    bf_path = pick_bf_path()
-    src = open(bf_path, "r", encoding="utf-8").read()
-    toks = desugar(fold_runs(sanitize(src)))
+    argv = sys.argv[1:]
+    execpy = "--execpy" in argv
+    unknown = [a for a in argv if a.startswith("-") and a != "--execpy"]
+    paths = [a for a in argv if not a.startswith("-")]
+    if unknown or len(paths) > 1:
+        print(f"Unknown option: {unknown[0]}" if unknown else f"Unexpected argument: {paths[1]}")
+        print("usage: bf2x.py [--execpy] [file.bf]"); sys.exit(2)
+    # Check the given path before the target menu, not after it.
+    if paths and not os.path.isfile(paths[0]):
+        print(f"No such file: {paths[0]}"); sys.exit(1)
+    choice = None if execpy else pick_target()
+    bf_path = paths[0] if paths else pick_bf_path()
+    toks = tokenize_file(bf_path)
     base = os.path.splitext(os.path.basename(bf_path))[0]
 
-    def emit_one(key):
-        name, ext, emitter, runner = TARGETS[key]
-        if key == "0": return
-        code = emitter(toks)
-        suffix = {
-            "python":"_py","go":"_go","cpp":"_cpp","csharp":"_cs",
-            "lua":"_lua","ruby":"_rb","rust":"_rs"
-        }[name]
-        out_path = write_out_next_to_input(bf_path, base, suffix, ext, code)
-        print(f"[ok] wrote {out_path}")
-        if runner: try_run(runner, out_path)
+    if execpy:
+        print("[run] -------- output --------")
+        exec_py(toks)
+        return
 
     if choice == "0":
-        for k in [k for k in TARGETS if k != "0"]:
-            emit_one(k)
+        # One line index of the tokens feeds every backend; auto-run afterwards.
+        keys = [k for k in TARGETS if k != "0"]
+        codes = emit_targets(toks, [TARGETS[k][0] for k in keys])
+        out_paths = {k: write_target(k, codes[TARGETS[k][0]], bf_path, base) for k in keys}
+        jobs = [(TARGETS[k][3], out_paths[k]) for k in keys if TARGETS[k][3]]
+        if OP_IN in toks[0]:
+            for runner, out_path in jobs: try_run(runner, out_path)
+        else:
+            run_concurrently(jobs)
     else:
-        emit_one(choice)
+        _, _, emitter, runner = TARGETS[choice]
+        out_path = write_target(choice, emitter(toks), bf_path, base)
+        if runner: try_run(runner, out_path)
 
 if __name__ == "__main__":
     main()
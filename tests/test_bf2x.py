@@ -0,0 +1,111 @@
+import io, os, sys, shutil, subprocess, tempfile, unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bf2x
+
+# A multiply loop at dp == 0 that is never entered: [<+>-] would touch
+# tape[-1] if its MUL stores ran unconditionally.
+NEG_MUL_UNENTERED = "[<+>-]" + "+" * 49 + "."
+
+def run_py(src):
+    ns = {}
+    exec(bf2x.build_py_code(bf2x.tokenize(src)), ns)
+    tape = bytearray(300000); out = bytearray()
+    ns["_run"](tape, 0, out.append, lambda: 0)
+    return tape, bytes(out)
+
+class MulGuardTest(unittest.TestCase):
+    def test_mul_loop_is_guarded(self):
+        ops, args = bf2x.tokenize(NEG_MUL_UNENTERED)
+        self.assertEqual(list(ops[:4]), [bf2x.OP_IF, bf2x.OP_MUL, bf2x.OP_CLR, bf2x.OP_CLOSE])
+        self.assertEqual(divmod(args[1], 256), (-1, 1))
+
+    def test_unentered_negative_offset_mul_leaves_tape_alone(self):
+        tape, out = run_py(NEG_MUL_UNENTERED)
+        self.assertEqual(out, b"1")
+        self.assertEqual(tape[-1], 0)
+
+    def test_entered_mul_loop(self):
+        self.assertEqual(run_py("+++[->++<]>.")[1], bytes([6]))
+
+    def test_guard_in_every_backend(self):
+        codes = bf2x.emit_targets(bf2x.tokenize(NEG_MUL_UNENTERED), list(bf2x.BACKENDS))
+        for name, code in codes.items():
+            lines = [l.strip() for l in code.splitlines()]
+            i = next(i for i, l in enumerate(lines) if "dp-1]" in l or "p[-1]" in l)
+            self.assertEqual(lines[i - 1], bf2x.BACKENDS[name][1][bf2x.OP_IF], name)
+
+    @unittest.skipUnless(shutil.which("g++"), "g++ not installed")
+    def test_cpp_unentered_mul_stays_on_tape(self):
+        # p[-1] at the start of the tape must sit behind the guard; ASan
+        # reports the out-of-bounds access if it runs.
+        with tempfile.TemporaryDirectory() as d:
+            src = os.path.join(d, "neg.cpp"); exe = os.path.join(d, "neg")
+            with open(src, "w") as f: f.write(bf2x.emit_cpp(bf2x.tokenize(NEG_MUL_UNENTERED)))
+            subprocess.check_call(["g++", "-fsanitize=address", "-o", exe, src])
+            self.assertEqual(subprocess.check_output([exe]), b"1")
+
+class ZeroRunTest(unittest.TestCase):
+    def tokens(self, src):
+        ops, args = bf2x.tokenize(src)
+        return list(zip(ops, args))
+
+    def test_adjacent_clears_merge(self):
+        self.assertEqual(self.tokens("[-]>[-]>[-]"), [(bf2x.OP_ZERO, 3), (bf2x.OP_RIGHT, 2)])
+
+    def test_extra_step_breaks_the_run(self):
+        self.assertEqual(self.tokens("[-]>[-]>>[-]"),
+                         [(bf2x.OP_ZERO, 2), (bf2x.OP_RIGHT, 3), (bf2x.OP_CLR, 1)])
+
+    def test_run_inside_outer_loop(self):
+        self.assertEqual(self.tokens("[[-]>[-]]"),
+                         [(bf2x.OP_OPEN, 1), (bf2x.OP_ZERO, 2), (bf2x.OP_RIGHT, 1), (bf2x.OP_CLOSE, 1)])
+
+    def test_run_clears_cells_and_moves_dp(self):
+        # The trailing + lands on the cell dp ends up on.
+        tape, _ = run_py("+>+>+>+<<<" "[-]>[-]>[-]" "++")
+        self.assertEqual(list(tape[:5]), [0, 0, 2, 1, 0])
+        tape, _ = run_py("+>+>+>+>+<<<<" "[-]>[-]>>[-]" "+")
+        self.assertEqual(list(tape[:6]), [0, 0, 1, 1, 1, 0])
+
+class EmptyBlockTest(unittest.TestCase):
+    def test_comment_loop_compiles(self):
+        # A leading [ comment ] is an empty loop once comments are stripped.
+        self.assertEqual(run_py("[ a comment loop ]++++++++[>++++++<-]>+.")[1], b"1")
+
+    def test_nested_empty_loop(self):
+        self.assertEqual(run_py("+[-[]]+.")[1], bytes([1]))
+
+    def test_program_without_ops(self):
+        self.assertEqual(run_py("no brainfuck here")[1], b"")
+
+    def test_emitted_python_runs(self):
+        code = bf2x.emit_python(bf2x.tokenize("[ a comment loop ]++++++++[>++++++<-]>+."))
+        out = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(out, b"1")
+
+class ExecPyTest(unittest.TestCase):
+    def test_too_deep_to_compile_is_reported(self):
+        buf = io.StringIO()
+        with redirect_stdout(buf): bf2x.exec_py(bf2x.tokenize("+" + "[" * 25 + "]" * 25))
+        self.assertIn("[err] can't compile program", buf.getvalue())
+
+class CliTest(unittest.TestCase):
+    def run_cli(self, *args):
+        return subprocess.run([sys.executable, bf2x.__file__, *args], input="1\n",
+                              capture_output=True, text=True)
+
+    def test_missing_file_is_reported_before_the_menu(self):
+        r = self.run_cli("nope.bf")
+        self.assertEqual(r.returncode, 1)
+        self.assertEqual(r.stdout, "No such file: nope.bf\n")
+
+    def test_bad_arguments_print_usage(self):
+        for args in (["--exec-py"], ["-h"], ["a.bf", "b.bf"]):
+            r = self.run_cli(*args)
+            self.assertEqual(r.returncode, 2, args)
+            self.assertIn("usage: bf2x.py", r.stdout)
+
+if __name__ == "__main__":
+    unittest.main()